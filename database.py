@@ -5,11 +5,11 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, WriteConcern
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -21,13 +21,29 @@ db = None
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
+# Pool bounds are per process: with N uvicorn workers the server sees up to
+# N * DB_POOL_SIZE connections, which must stay below Mongo's connection limit.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MIN_POOL = int(os.getenv("DB_MIN_POOL", "2"))
+
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = MongoClient(
+        database_url,
+        maxPoolSize=DB_POOL_SIZE,
+        minPoolSize=DB_MIN_POOL,
+        maxIdleTimeMS=30000,
+        serverSelectionTimeoutMS=3000,
+        retryWrites=True,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
+def create_document(collection_name: str, data: Union[BaseModel, dict], durable: bool = True):
+    """Insert a single document with timestamp
+
+    With durable=False the write is unacknowledged (w=0): it returns once the
+    request is sent, and failures are not reported.
+    """
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
@@ -40,15 +56,82 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    collection = db[collection_name]
+    if not durable:
+        collection = collection.with_options(write_concern=WriteConcern(w=0))
+    result = collection.insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+def create_documents(collection_name: str, items: List[Union[BaseModel, dict]]):
+    """Insert many documents with timestamps in a single round-trip"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        docs.append(data_dict)
+
+    result = db[collection_name].insert_many(docs)
+    return [str(_id) for _id in result.inserted_ids]
+
+def ensure_indexes():
+    """Create the indexes backing the sorted/filtered queries"""
+    if db is None:
+        return
+    db["transaction"].create_index([("timestamp", DESCENDING)])
+    db["transaction"].create_index([("risk_level", ASCENDING), ("timestamp", DESCENDING)])
+    # Backs the periodic confirmed-fraud blocklist scan
+    db["transaction"].create_index([("is_fraud", ASCENDING)], partialFilterExpression={"is_fraud": True})
+    db["alert"].create_index([("created_at", DESCENDING)])
+
+def update_document(collection_name: str, filter_dict: dict, data: dict):
+    """Update a single document, bumping updated_at
+
+    In-place changes (e.g. setting the is_fraud label) must go through here so
+    that list ETags, which are derived from updated_at, change with them.
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    update = dict(data)
+    update['updated_at'] = datetime.now(timezone.utc)
+    result = db[collection_name].update_one(filter_dict, {"$set": update})
+    return result.modified_count
+
+def delete_documents(collection_name: str, filter_dict: dict):
+    """Delete all documents matching the filter"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    result = db[collection_name].delete_many(filter_dict)
+    return result.deleted_count
+
+def count_documents(collection_name: str, filter_dict: dict = None):
+    """Count documents matching the filter"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    return db[collection_name].count_documents(filter_dict or {})
+
+def iter_documents(collection_name: str, filter_dict: dict = None, projection: dict = None):
+    """Stream documents from collection without materialising them in a list"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    return db[collection_name].find(filter_dict or {}, projection)
+
+def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None, sort: list = None):
+    """Get documents from collection, optionally projected and sorted server-side"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
     
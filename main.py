@@ -1,15 +1,44 @@
+import asyncio
+import bisect
+import functools
+import hashlib
+import logging
 import os
-from datetime import datetime, timezone
+import random
+import time
 from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException
+import numpy as np
+import orjson
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pybloom_live import BloomFilter
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from database import (
+    db, database_name, database_url, count_documents, create_document, create_documents, delete_documents,
+    ensure_indexes, get_documents, iter_documents,
+)
+from schemas import Transaction, Alert, CHANNEL_CODES, COUNTRY_CODE_UNKNOWN, MCC_CODES, country_to_code
+
+class MongoJSONResponse(ORJSONResponse):
+    """ORJSON response that stringifies ObjectId and other non-native types"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=str)
+
+
+app = FastAPI(title="Fraud Detection API", default_response_class=MongoJSONResponse)
 
-from database import db, create_document, get_documents
-from schemas import Transaction, Alert
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Fraud Detection API")
+# Database settings come from database.py's single read of the environment
+# (PORT is only needed, and parsed, when run as a script)
+_HAS_DB_URL = bool(database_url)
+_HAS_DB_NAME = bool(database_name)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,12 +48,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_database_pool():
+    # Open the first pooled connection before serving requests
+    if db is None:
+        return
+    try:
+        await run_in_threadpool(db.command, "ping")
+    except Exception as e:
+        logger.warning("Database ping failed on startup: %s", e)
+
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        await run_in_threadpool(ensure_indexes)
+    except Exception as e:
+        logger.warning("Could not create database indexes: %s", e)
+
 @app.get("/")
 def read_root():
     return {"message": "Fraud Detection API is running"}
 
+# /test is hit by load-balancer probes: serve a pre-serialised payload for a
+# short TTL and list collections at most every few seconds.
+_TEST_CACHE_TTL = 1.0
+_COLLECTIONS_CACHE_TTL = 5.0
+_test_cache = None  # (expires_at, json bytes)
+_collections_cache = None  # (expires_at, collection names)
+
+
+async def _list_collection_names() -> List[str]:
+    global _collections_cache
+    if _collections_cache is None or _collections_cache[0] <= time.monotonic():
+        # Blocking Mongo round-trip: keep it off the event loop
+        names = await run_in_threadpool(db.list_collection_names)
+        _collections_cache = (time.monotonic() + _COLLECTIONS_CACHE_TTL, names[:10])
+    return _collections_cache[1]
+
+
 @app.get("/test")
-def test_database():
+async def test_database():
+    global _test_cache
+    now = time.monotonic()
+    if _test_cache is not None and _test_cache[0] > now:
+        return Response(content=_test_cache[1], media_type="application/json")
+
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -40,8 +108,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                response["collections"] = await _list_collection_names()
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
@@ -50,50 +117,189 @@ def test_database():
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:50]}"
 
-    response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-    response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+    response["database_url"] = "✅ Set" if _HAS_DB_URL else "❌ Not Set"
+    response["database_name"] = "✅ Set" if _HAS_DB_NAME else "❌ Not Set"
 
-    return response
+    body = orjson.dumps(response)
+    _test_cache = (now + _TEST_CACHE_TTL, body)
+    return Response(content=body, media_type="application/json")
 
 # Helper to compute risk score
 
-def compute_risk_score(tx: Transaction) -> float:
-    score = 0.0
-    # Amount-based risk
-    if tx.amount >= 5000:
-        score += 50
-    elif tx.amount >= 1000:
-        score += 25
-    elif tx.amount >= 200:
-        score += 10
+_RISKY_COUNTRIES = frozenset({"RU", "NG", "UA", "BR", "CN"})
+_RISKY_CHANNELS = frozenset({"web", "card-not-present"})
+_HIGH_RISK_MCC = frozenset({"gambling", "crypto", "adult"})
+
+
+def _code_bitmap(codes) -> int:
+    """Pack category codes into an int bitmap"""
+    bitmap = 0
+    for code in codes:
+        bitmap |= 1 << code
+    return bitmap
+
+
+# Rule sets over the interned category codes from schemas.py
+# (the country bitmap spans the 26x26 ISO-2 letter-pair grid)
+_RISKY_COUNTRY_BITMAP = _code_bitmap(country_to_code(c) for c in _RISKY_COUNTRIES)
+_RISKY_CHANNEL_BITMAP = _code_bitmap(CHANNEL_CODES[c] for c in _RISKY_CHANNELS)
+_HIGH_RISK_MCC_BITMAP = _code_bitmap(MCC_CODES[c] for c in _HIGH_RISK_MCC)
+
+
+# Known-bad actors from confirmed fraud labels (is_fraud is only set outside
+# the API; the create endpoints drop it from client payloads). Bloom filters
+# keep membership tests to a few hashes; a false positive (0.1%) only means
+# the transaction is scored high and raises an alert for review. Filters are
+# sized from the current label count with headroom (~1.8 bytes per entry at
+# this error rate), so workers don't hold mostly empty filters.
+_BLOCKLIST_MIN_CAPACITY = int(os.getenv("BLOCKLIST_MIN_CAPACITY", "10000"))
+_BLOCKLIST_ERROR_RATE = 0.001
+_BLOCKLIST_REFRESH_SECONDS = int(os.getenv("BLOCKLIST_REFRESH_SECONDS", "300"))
+_FRAUD_LABEL_FILTER = {"is_fraud": True}
+_bad_users = frozenset()
+_bad_ips = frozenset()
+_blocklist_task = None
+
+
+def _load_blocklists():
+    """Build Bloom filters of user IDs and IPs seen on confirmed-fraud transactions"""
+    capacity = max(_BLOCKLIST_MIN_CAPACITY, 2 * count_documents("transaction", _FRAUD_LABEL_FILTER))
+    bad_users = BloomFilter(capacity=capacity, error_rate=_BLOCKLIST_ERROR_RATE)
+    bad_ips = BloomFilter(capacity=capacity, error_rate=_BLOCKLIST_ERROR_RATE)
+    labels = iter_documents("transaction", _FRAUD_LABEL_FILTER, {"_id": 0, "user_id": 1, "ip_address": 1})
+    for doc in labels:
+        if doc.get("user_id"):
+            bad_users.add(doc["user_id"])
+        if doc.get("ip_address"):
+            bad_ips.add(doc["ip_address"])
+    return bad_users, bad_ips
+
+
+async def _refresh_blocklists():
+    global _bad_users, _bad_ips
+    while True:
+        try:
+            _bad_users, _bad_ips = await run_in_threadpool(_load_blocklists)
+        except Exception as e:
+            logger.warning("Could not refresh fraud blocklists: %s", e)
+        # Jitter so the workers don't all rescan the collection at the same moment
+        await asyncio.sleep(_BLOCKLIST_REFRESH_SECONDS * random.uniform(0.8, 1.2))
+
+
+@app.on_event("startup")
+async def start_blocklist_refresh():
+    global _blocklist_task
+    if db is not None:
+        _blocklist_task = asyncio.create_task(_refresh_blocklists())
+
+
+@app.on_event("shutdown")
+async def stop_blocklist_refresh():
+    if _blocklist_task is not None:
+        _blocklist_task.cancel()
+
+
+def _is_blocklisted(tx: Transaction) -> bool:
+    return tx.user_id in _bad_users or (tx.ip_address is not None and tx.ip_address in _bad_ips)
 
-    # Country risk
-    risky_countries = {"RU", "NG", "UA", "BR", "CN"}
-    if tx.country and tx.country.upper() in risky_countries:
-        score += 15
 
-    # Channel risk
-    if tx.channel and tx.channel.lower() in {"web", "card-not-present"}:
-        score += 10
+# Amount tiers: [0, 200) -> 0, [200, 1000) -> 10, [1000, 5000) -> 25, [5000, inf) -> 50
+_AMOUNT_THRESHOLDS = (200, 1000, 5000)
+_AMOUNT_SCORES = (0.0, 10.0, 25.0, 50.0)
 
-    # Merchant category hints
-    high_risk_mcc = {"gambling", "crypto", "adult"}
-    if tx.merchant_category and tx.merchant_category.lower() in high_risk_mcc:
-        score += 10
 
-    # IP/device missing
-    if not tx.ip_address or not tx.device_id:
-        score += 5
+@functools.lru_cache(maxsize=65536)
+def _score_features(amount_tier: int, country_code: int, channel_code: int, mcc_code: int, missing_ident: bool) -> float:
+    # Flag-style rules: country, channel, merchant category, missing IP/device
+    flag_score = (
+        15 * ((_RISKY_COUNTRY_BITMAP >> country_code) & 1)
+        + 10 * ((_RISKY_CHANNEL_BITMAP >> channel_code) & 1)
+        + 10 * ((_HIGH_RISK_MCC_BITMAP >> mcc_code) & 1)
+        + 5 * missing_ident
+    )
 
-    return min(score, 100.0)
+    score = _AMOUNT_SCORES[amount_tier] + flag_score
+    return score if score < 100.0 else 100.0
+
+
+def compute_risk_score(tx: Transaction) -> float:
+    # Known-bad user or IP: skip the rule evaluation entirely
+    if _is_blocklisted(tx):
+        return 100.0
+    # Reduce the transaction to hashable features and memoise on those
+    return _score_features(
+        bisect.bisect_right(_AMOUNT_THRESHOLDS, tx.amount),
+        tx.country_code,
+        tx.channel_code,
+        tx.mcc_code,
+        not tx.ip_address or not tx.device_id,
+    )
+
+
+_AMOUNT_THRESHOLDS_ARR = np.array(_AMOUNT_THRESHOLDS, dtype=np.float64)
+_AMOUNT_SCORES_ARR = np.array(_AMOUNT_SCORES, dtype=np.float32)
+
+
+def _code_lut(size: int, bitmap: int) -> np.ndarray:
+    """Boolean lookup table indexed by category code"""
+    return np.array([(bitmap >> code) & 1 for code in range(size)], dtype=bool)
+
+
+_RISKY_COUNTRY_LUT = _code_lut(COUNTRY_CODE_UNKNOWN + 1, _RISKY_COUNTRY_BITMAP)
+_RISKY_CHANNEL_LUT = _code_lut(len(CHANNEL_CODES) + 1, _RISKY_CHANNEL_BITMAP)
+_HIGH_RISK_MCC_LUT = _code_lut(len(MCC_CODES) + 1, _HIGH_RISK_MCC_BITMAP)
+
+
+def compute_risk_scores_batch(
+    amounts: np.ndarray,
+    risky_country: np.ndarray,
+    risky_channel: np.ndarray,
+    risky_mcc: np.ndarray,
+    missing_ident: np.ndarray,
+) -> np.ndarray:
+    """Vectorised compute_risk_score over struct-of-arrays columns.
+
+    The flag columns are boolean arrays aligned with ``amounts``.
+    Returns a float32 array of scores in [0, 100].
+    """
+    scores = _AMOUNT_SCORES_ARR[np.searchsorted(_AMOUNT_THRESHOLDS_ARR, amounts, side="right")]
+    scores += (
+        np.float32(15) * risky_country
+        + np.float32(10) * risky_channel
+        + np.float32(10) * risky_mcc
+        + np.float32(5) * missing_ident
+    )
+    return np.minimum(scores, np.float32(100), out=scores)
+
+
+def score_transactions(txs: List[Transaction]) -> np.ndarray:
+    """Transpose transactions into columns and score them in one pass"""
+    n = len(txs)
+    amounts = np.fromiter((tx.amount for tx in txs), dtype=np.float64, count=n)
+    country_codes = np.fromiter((tx.country_code for tx in txs), dtype=np.int16, count=n)
+    channel_codes = np.fromiter((tx.channel_code for tx in txs), dtype=np.int8, count=n)
+    mcc_codes = np.fromiter((tx.mcc_code for tx in txs), dtype=np.int8, count=n)
+    missing_ident = np.fromiter(
+        (not tx.ip_address or not tx.device_id for tx in txs), dtype=bool, count=n
+    )
+    blocked = np.fromiter((_is_blocklisted(tx) for tx in txs), dtype=bool, count=n)
+    scores = compute_risk_scores_batch(
+        amounts,
+        _RISKY_COUNTRY_LUT[country_codes],
+        _RISKY_CHANNEL_LUT[channel_codes],
+        _HIGH_RISK_MCC_LUT[mcc_codes],
+        missing_ident,
+    )
+    scores[blocked] = 100
+    return scores
+
+
+# Risk level for every integer score in [0, 100]: low < 40 <= medium < 70 <= high
+_LEVEL_TABLE = tuple("low" if s < 40 else "medium" if s < 70 else "high" for s in range(101))
 
 
 def score_to_level(score: float) -> str:
-    if score >= 70:
-        return "high"
-    if score >= 40:
-        return "medium"
-    return "low"
+    return _LEVEL_TABLE[int(score)]
 
 
 class CreateTransactionRequest(Transaction):
@@ -104,6 +310,12 @@ class CreateTransactionResponse(BaseModel):
     risk_score: float
     risk_level: str
 
+class CreateTransactionBatchRequest(BaseModel):
+    items: List[CreateTransactionRequest] = Field(..., min_length=1, max_length=1000)
+
+class CreateTransactionBatchResponse(BaseModel):
+    items: List[CreateTransactionResponse]
+
 class ListTransactionsResponse(BaseModel):
     items: List[dict]
 
@@ -111,62 +323,189 @@ class ListAlertsResponse(BaseModel):
     items: List[dict]
 
 
+async def _write_with_alerts(tx_write, tx_ids: list, alert_write=None, alert_ids: list = ()):
+    """Await transaction and alert inserts together.
+
+    The writes run concurrently, so if the transaction insert fails (including
+    a partial insert_many failure) every transaction and alert of the request
+    is deleted again by its pre-generated _id. Nothing is left referencing a
+    missing transaction, and a client retry doesn't duplicate stored rows.
+    """
+    writes = [tx_write] if alert_write is None else [tx_write, alert_write]
+    results = await asyncio.gather(*writes, return_exceptions=True)
+    tx_result = results[0]
+    if isinstance(tx_result, BaseException):
+        try:
+            await run_in_threadpool(delete_documents, "transaction", {"_id": {"$in": list(tx_ids)}})
+            if alert_ids:
+                await run_in_threadpool(delete_documents, "alert", {"_id": {"$in": list(alert_ids)}})
+        except Exception as e:
+            logger.error("Rollback after failed transaction write did not complete: %s", e)
+        raise tx_result
+    if len(results) > 1 and isinstance(results[1], BaseException):
+        raise results[1]
+
+
+_ALERT_REASON = "High-risk transaction: ${amount} {currency} at {merchant}"
+
+
+def _transaction_doc(tx: Transaction, score: float, level: str) -> dict:
+    """Build the stored transaction document, with a pre-generated _id"""
+    # is_fraud is a confirmed label that feeds the blocklists; never accept it from clients
+    data = tx.model_dump(exclude_none=True, exclude={"is_fraud"})
+    data["risk_score"] = score
+    data["risk_level"] = level
+    # Pre-generate the _id so the alert can reference it without waiting for the insert
+    data["_id"] = ObjectId()
+    return data
+
+
+def _build_alert(tx: Transaction, transaction_ref: str, score: float, level: str) -> dict:
+    """Build the stored alert document for a high-risk transaction"""
+    # Server-built from validated input, so skip re-validation
+    alert = Alert.model_construct(
+        transaction_ref=transaction_ref,
+        user_id=tx.user_id,
+        reason=_ALERT_REASON.format_map({
+            "amount": tx.amount,
+            "currency": tx.currency,
+            "merchant": tx.merchant or "unknown merchant",
+        }),
+        risk_score=score,
+        risk_level=level,
+        tags=[t for t in [tx.merchant_category, tx.channel, tx.country] if t]
+    ).model_dump()
+    alert["_id"] = ObjectId()
+    return alert
+
+
 @app.post("/api/transactions", response_model=CreateTransactionResponse)
 async def create_transaction(payload: CreateTransactionRequest):
-    data = payload.model_dump()
-    if not data.get("timestamp"):
-        data["timestamp"] = datetime.now(timezone.utc)
-
     # Compute risk
     score = compute_risk_score(payload)
     level = score_to_level(score)
-    data["risk_score"] = score
-    data["risk_level"] = level
+    data = _transaction_doc(payload, score, level)
+    inserted_id = str(data["_id"])
 
-    # Store transaction
-    inserted_id = create_document("transaction", data)
-
-    # If high risk, create an alert
+    # Store transaction off the event loop (PyMongo is blocking)
     if level == "high":
-        alert = Alert(
-            transaction_ref=inserted_id,
-            user_id=payload.user_id,
-            reason=f"High-risk transaction: ${payload.amount} {payload.currency} at {payload.merchant or 'unknown merchant'}",
-            risk_score=score,
-            risk_level=level,
-            tags=[t for t in [payload.merchant_category, payload.channel, payload.country] if t]
+        alert = _build_alert(payload, inserted_id, score, level)
+        # Write the transaction and its alert concurrently: one round-trip of latency
+        await _write_with_alerts(
+            run_in_threadpool(create_document, "transaction", data),
+            [data["_id"]],
+            run_in_threadpool(create_document, "alert", alert),
+            [alert["_id"]],
         )
-        create_document("alert", alert)
+    else:
+        # Low/medium risk: trade write acknowledgement for latency
+        await run_in_threadpool(create_document, "transaction", data, durable=False)
 
     return {"id": inserted_id, "risk_score": score, "risk_level": level}
 
 
-@app.get("/api/transactions", response_model=ListTransactionsResponse)
-async def list_transactions(limit: Optional[int] = 50):
-    limit = min(max(1, limit or 50), 200)
-    items = get_documents("transaction", {}, limit)
-    # Convert ObjectId to str
+@app.post("/api/transactions/batch", response_model=CreateTransactionBatchResponse)
+async def create_transactions_batch(payload: CreateTransactionBatchRequest):
+    txs = payload.items
+    scores = score_transactions(txs).tolist()
+    levels = [score_to_level(score) for score in scores]
+    docs = [_transaction_doc(tx, score, level) for tx, score, level in zip(txs, scores, levels)]
+    inserted_ids = [str(data["_id"]) for data in docs]
+
+    alerts = [
+        _build_alert(tx, inserted_id, score, level)
+        for tx, inserted_id, score, level in zip(txs, inserted_ids, scores, levels)
+        if level == "high"
+    ]
+
+    # Store all transactions, and their alerts, in a single concurrent round-trip
+    await _write_with_alerts(
+        run_in_threadpool(create_documents, "transaction", docs),
+        [data["_id"] for data in docs],
+        run_in_threadpool(create_documents, "alert", alerts) if alerts else None,
+        [alert["_id"] for alert in alerts],
+    )
+
+    return {
+        "items": [
+            {"id": inserted_id, "risk_score": score, "risk_level": level}
+            for inserted_id, score, level in zip(inserted_ids, scores, levels)
+        ]
+    }
+
+
+def _clamp_int(v: int, lo: int, hi: int) -> int:
+    v = lo if v < lo else v
+    return hi if v > hi else v
+
+
+# Only fetch the fields the list endpoints actually return (updated_at is the
+# per-document version the list ETag is derived from)
+_TRANSACTION_PROJECTION = dict.fromkeys(["_id", *Transaction.model_fields, "created_at", "updated_at"], 1)
+_ALERT_PROJECTION = dict.fromkeys(["_id", *Alert.model_fields, "created_at", "updated_at"], 1)
+
+
+_LIST_CACHE_CONTROL = "max-age=1, stale-while-revalidate=2"
+
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header (comma-separated, W/ allowed)"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or _strip_weak(tag) == _strip_weak(etag):
+            return True
+    return False
+
+
+def _list_response(request: Request, items: List[dict]) -> Response:
+    """Build a list response with an ETag, or a bare 304 if the client's copy is current.
+
+    The response is returned directly so that ObjectId/datetime values are
+    serialised by orjson instead of the response_model pipeline.
+    """
+    # Hash every returned _id with its version (at most 200) so inserts anywhere
+    # in the page, and in-place updates such as fraud relabelling, change the
+    # tag. is_fraud is included in case a label is written without bumping
+    # updated_at. The tag is weak: it tracks the documents, not the exact bytes.
+    digest = hashlib.blake2b(digest_size=8)
     for it in items:
-        if "_id" in it:
-            it["_id"] = str(it["_id"])
-        if isinstance(it.get("timestamp"), datetime):
-            it["timestamp"] = it["timestamp"].isoformat()
-    return {"items": items}
+        digest.update(f"{it.get('_id', '')}|{it.get('updated_at', '')}|{it.get('is_fraud', '')},".encode())
+    etag = 'W/"%s"' % digest.hexdigest()
+    headers = {"ETag": etag, "Cache-Control": _LIST_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return MongoJSONResponse({"items": items}, headers=headers)
+
+
+@app.get("/api/transactions", response_model=ListTransactionsResponse)
+async def list_transactions(request: Request, limit: Optional[int] = 50):
+    limit = _clamp_int(limit or 50, 1, 200)
+    # Blocking Mongo round-trip: keep it off the event loop
+    items = await run_in_threadpool(
+        get_documents, "transaction", {}, limit, projection=_TRANSACTION_PROJECTION, sort=[("timestamp", -1)]
+    )
+    return _list_response(request, items)
 
 
 @app.get("/api/alerts", response_model=ListAlertsResponse)
-async def list_alerts(limit: Optional[int] = 50):
-    limit = min(max(1, limit or 50), 200)
-    items = get_documents("alert", {}, limit)
-    for it in items:
-        if "_id" in it:
-            it["_id"] = str(it["_id"])
-        if isinstance(it.get("created_at"), datetime):
-            it["created_at"] = it["created_at"].isoformat()
-    return {"items": items}
+async def list_alerts(request: Request, limit: Optional[int] = 50):
+    limit = _clamp_int(limit or 50, 1, 200)
+    items = await run_in_threadpool(
+        get_documents, "alert", {}, limit, projection=_ALERT_PROJECTION, sort=[("created_at", -1)]
+    )
+    return _list_response(request, items)
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Multiple workers require the app import string rather than the app object;
+    # loop="auto" picks uvloop where it is installed (not on Windows)
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers, loop="auto", http="httptools")
@@ -11,9 +11,10 @@ Model name is converted to lowercase for the collection name:
 - BlogPost -> "blogs" collection
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field, field_validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import cached_property
 
 # Example schemas (retain for reference)
 
@@ -41,6 +42,23 @@ class Product(BaseModel):
 
 # Fraud detection app schemas
 
+# Category tables used to intern free-form transaction attributes into small
+# integer codes. Code 0 is reserved for "unknown / not listed".
+CHANNEL_CODES = {c: i for i, c in enumerate(["card", "web", "mobile", "card-not-present"], start=1)}
+MCC_CODES = {c: i for i, c in enumerate(["gambling", "crypto", "adult"], start=1)}
+
+# Countries are ISO-2 letter pairs, packed arithmetically into 0..675
+# (case-insensitive via the low five bits of each ASCII letter). Anything
+# that isn't two ASCII letters maps to COUNTRY_CODE_UNKNOWN.
+COUNTRY_CODE_UNKNOWN = 26 * 26
+
+
+def country_to_code(country: Optional[str]) -> int:
+    if country and len(country) == 2 and country.isascii() and country.isalpha():
+        return ((ord(country[0]) & 0x1F) - 1) * 26 + (ord(country[1]) & 0x1F) - 1
+    return COUNTRY_CODE_UNKNOWN
+
+
 class Transaction(BaseModel):
     """
     Transactions collection schema
@@ -54,7 +72,7 @@ class Transaction(BaseModel):
     merchant_category: Optional[str] = Field(None, description="MCC or category")
     country: Optional[str] = Field("US", description="Country code")
     channel: Optional[str] = Field("card", description="Channel, e.g., card, web, mobile")
-    timestamp: Optional[datetime] = Field(None, description="Event time; defaults to now if missing")
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), description="Event time; defaults to now if missing")
     device_id: Optional[str] = Field(None, description="Device identifier")
     ip_address: Optional[str] = Field(None, description="IP address")
     # Labels/derived fields (may be set by backend)
@@ -62,6 +80,38 @@ class Transaction(BaseModel):
     risk_level: Optional[str] = Field(None, description="low|medium|high")
     is_fraud: Optional[bool] = Field(False, description="Confirmed fraud label")
 
+    @field_validator("timestamp", mode="before")
+    @classmethod
+    def _default_null_timestamp(cls, v):
+        # Explicit null keeps meaning "now", as before the field became required
+        return datetime.now(timezone.utc) if v is None else v
+
+    @field_validator("country")
+    @classmethod
+    def _normalize_country(cls, v: Optional[str]) -> Optional[str]:
+        return v.upper() if v else v
+
+    @field_validator("channel", "merchant_category")
+    @classmethod
+    def _normalize_lower(cls, v: Optional[str]) -> Optional[str]:
+        return v.lower() if v else v
+
+    # Category codes are computed once per instance and reused by scoring and model_dump
+    @computed_field
+    @cached_property
+    def country_code(self) -> int:
+        return country_to_code(self.country)
+
+    @computed_field
+    @cached_property
+    def channel_code(self) -> int:
+        return CHANNEL_CODES.get(self.channel, 0)
+
+    @computed_field
+    @cached_property
+    def mcc_code(self) -> int:
+        return MCC_CODES.get(self.merchant_category, 0)
+
 class Alert(BaseModel):
     """
     Alerts collection schema